@@ -15,9 +15,12 @@ Key features:
 - D/ST synthesized from team nickname.
 """
 
-import json, os, re, time
+import hashlib, json, os, re, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Any
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 
 # ---- Team codes/slugs and abbrs ----
@@ -65,23 +68,67 @@ TEAM_ABBR = {
 }
 
 HEADERS = { "User-Agent": "FortifiedFantasy/1.0 (+https://fortifiedfantasy.com)" }
+MAX_WORKERS = 8  # concurrent team pages (polite to ESPN)
+CACHE_DIR = os.path.join("data", ".http_cache")  # ETag/Last-Modified cache
+
+# One keep-alive session shared by all worker threads
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16,
+                                      max_retries=Retry(total=3, backoff_factor=0.3)))
 
 # ---- Helpers ----
 DEPTH_LABELS = {"1ST","2ND","3RD","4TH","5TH","-","RES","IR","PUP","SUS","PS"}
 OFFENSE_POS_TOKENS = {"QB","RB","HB","TB","FB","WR","TE","LT","LG","C","RG","RT"}
 SPECIAL_POS_TOKENS = {"K","PK"}
 
+LIST_NUM_RE = re.compile(r"^\d+\.\s*")
+
 def clean(txt: str) -> str:
-    t = re.sub(r"\s+", " ", txt or "").strip()
-    t = re.sub(r"^\d+\.\s*", "", t)  # strip "12. Joe Burrow"
-    return t
+    t = " ".join((txt or "").split())  # collapse whitespace without regex
+    return LIST_NUM_RE.sub("", t)  # strip "12. Joe Burrow"
+
+def uniq(seq: List[str]) -> List[str]:
+    return list(dict.fromkeys(seq))
+
+def pick_top(n: int, seq: List[str]) -> List[str]:
+    """First n distinct, non-empty names; stops scanning once n are found."""
+    out: List[str] = []
+    for nm in seq:
+        if nm and nm not in out:  # out holds at most n items
+            out.append(nm)
+            if len(out) == n:
+                break
+    return out
 
 def is_depth_label(txt: str) -> bool:
     return txt and txt.strip().upper() in DEPTH_LABELS
 
 def fetch_html(url: str) -> str:
-    r = requests.get(url, headers=HEADERS, timeout=20)
+    """GET with an on-disk conditional cache; a 304 reuses the stored body."""
+    cache_path = os.path.join(CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + ".json")
+    cached = None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    headers = {}
+    if cached:
+        if cached.get("etag"): headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"): headers["If-Modified-Since"] = cached["last_modified"]
+
+    r = SESSION.get(url, headers=headers, timeout=20)
+    if r.status_code == 304 and cached:
+        return cached["body"]
     r.raise_for_status()
+
+    etag, last_mod = r.headers.get("ETag"), r.headers.get("Last-Modified")
+    if etag or last_mod:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"etag": etag, "last_modified": last_mod, "body": r.text}, f)
     return r.text
 
 def extract_names_from_cells_anchors(cells) -> List[str]:
@@ -131,20 +178,15 @@ def parse_classic_tables(soup: BeautifulSoup, slots: Dict[str, List[str]]):
             if not names:
                 continue
             if pos_norm == "QB":
-                for nm in names[:2]:
-                    if nm not in slots["QB"]: slots["QB"].append(nm)
+                slots["QB"].extend(names[:2])
             elif pos_norm in {"RB","HB","TB","FB"}:
-                for nm in names[:2]:
-                    if nm not in slots["RB"]: slots["RB"].append(nm)
+                slots["RB"].extend(names[:2])
             elif pos_norm == "WR":
-                for nm in names:
-                    if nm not in wr_bucket: wr_bucket.append(nm)
+                wr_bucket.extend(names)
             elif pos_norm == "TE":
-                for nm in names[:2]:
-                    if nm not in slots["TE"]: slots["TE"].append(nm)
-        for i, nm in enumerate(wr_bucket[:3], start=1):
-            key = f"WR{i}"
-            if nm not in slots[key]: slots[key].append(nm)
+                slots["TE"].extend(names[:2])
+        for i, nm in enumerate(pick_top(3, wr_bucket), start=1):
+            slots[f"WR{i}"].append(nm)
 
     # Extract from a special teams table
     def parse_special_table(tbl):
@@ -159,8 +201,7 @@ def parse_classic_tables(soup: BeautifulSoup, slots: Dict[str, List[str]]):
             if pos_norm in {"K","PK"}:
                 names = extract_names_from_cells_anchors(cells[1:])
                 if names:
-                    nm = names[0]
-                    if nm not in slots["K"]: slots["K"].append(nm)
+                    slots["K"].append(names[0])
 
     for tbl in soup.find_all("table"):
         kind = classify_table(tbl)
@@ -211,29 +252,23 @@ def parse_fixed_left_blocks(soup: BeautifulSoup, slots: Dict[str, List[str]]):
                 continue
 
             if pos_norm == "QB":
-                for nm in names[:2]:
-                    if nm not in slots["QB"]: slots["QB"].append(nm)
+                slots["QB"].extend(names[:2])
 
             elif pos_norm in {"RB","HB","TB","FB"}:
-                for nm in names[:2]:
-                    if nm not in slots["RB"]: slots["RB"].append(nm)
+                slots["RB"].extend(names[:2])
 
             elif pos_norm == "WR":
-                for nm in names:
-                    if nm not in wr_bucket: wr_bucket.append(nm)
+                wr_bucket.extend(names)
 
             elif pos_norm == "TE":
-                for nm in names[:2]:
-                    if nm not in slots["TE"]: slots["TE"].append(nm)
+                slots["TE"].extend(names[:2])
 
             elif pos_norm in {"K","PK"}:
-                nm = names[0]
-                if nm not in slots["K"]: slots["K"].append(nm)
+                slots["K"].append(names[0])
 
     # Map first three WRs found across the block(s)
-    for i, nm in enumerate(wr_bucket[:3], start=1):
-        key = f"WR{i}"
-        if nm not in slots[key]: slots[key].append(nm)
+    for i, nm in enumerate(pick_top(3, wr_bucket), start=1):
+        slots[f"WR{i}"].append(nm)
 
 # ---- Team page parser (combines both strategies) ----
 def parse_team_depth_chart(html: str, team_code: str) -> Dict[str, Any]:
@@ -247,9 +282,10 @@ def parse_team_depth_chart(html: str, team_code: str) -> Dict[str, Any]:
 
     # D/ST synthesized from nickname
     city, nick = ESPN_CODES[team_code]
-    dst_label = f"{nick} D/ST"
-    if dst_label not in slots["DST"]:
-        slots["DST"].append(dst_label)
+    slots["DST"].append(f"{nick} D/ST")
+
+    # Single dedupe pass per slot (first-seen order wins)
+    slots = {k: uniq(v) for k, v in slots.items()}
 
     return {
         "teamCode": team_code,
@@ -259,6 +295,11 @@ def parse_team_depth_chart(html: str, team_code: str) -> Dict[str, Any]:
     }
 
 # ---- Driver ----
+def fetch_team(code: str) -> Dict[str, Any]:
+    url = f"https://www.espn.com/nfl/team/depth/_/name/{code}"
+    print(f"[fetch] {code.upper()} -> {url}")
+    return parse_team_depth_chart(fetch_html(url), code)
+
 def main():
     os.makedirs("data", exist_ok=True)
     results: Dict[str, Any] = {
@@ -268,16 +309,21 @@ def main():
         "teams": {}
     }
 
+    teams: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = {ex.submit(fetch_team, code): code for code in ESPN_CODES}
+        for fut in as_completed(futures):
+            code = futures[fut]
+            try:
+                teams[code] = fut.result()
+            except Exception as e:
+                print(f"[warn] {code.upper()} failed: {e}")
+
+    # Keep output in ESPN_CODES order regardless of completion order
     for code in ESPN_CODES:
-        url = f"https://www.espn.com/nfl/team/depth/_/name/{code}"
-        print(f"[fetch] {code.upper()} -> {url}")
-        try:
-            html = fetch_html(url)
-            team = parse_team_depth_chart(html, code)
+        if code in teams:
+            team = teams[code]
             results["teams"][team["teamAbbr"]] = team["slots"]
-            time.sleep(0.5)  # polite
-        except Exception as e:
-            print(f"[warn] {code.upper()} failed: {e}")
 
     out_path = os.path.join("data", "depth_charts_2025.json")
     with open(out_path, "w", encoding="utf-8") as f:
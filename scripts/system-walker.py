@@ -16,10 +16,11 @@ Changes from previous version:
 """
 
 import argparse, os, re, sys, shutil
+from array import array
 from pathlib import Path
-from html.parser import HTMLParser
-import ast
-from collections import defaultdict, deque
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # ---------------- Comment styles ----------------
 COMMENT_STYLES = {
@@ -36,9 +37,13 @@ COMMENT_STYLES = {
     ".sql": ("-- ", ""), ".md": ("<!-- ", " -->"),
 }
 UNCOMMENTABLE = {".json"}
-import fnmatch
 
-BAK_RE = re.compile(r"\.bak(\d+)?$", re.IGNORECASE)
+# Per-file read/stamp work is I/O-bound, so threads overlap the syscalls
+IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Stamping batches at least this large go to a process pool (spawn cost pays off)
+PROCESS_MIN_FILES = 64
+
+BAK_RE = re.compile(r"\.bak(\d+)?$", re.IGNORECASE | re.ASCII)
 
 def is_bak(path: Path) -> bool:
     return bool(BAK_RE.search(path.name))
@@ -52,51 +57,213 @@ def build_comment(ext: str, key: str, value: str) -> str:
     pre, suf = COMMENT_STYLES[ext]
     return f"{pre}{key}: {value}{suf}\n"
 
+@lru_cache(maxsize=None)
+def _comment_affixes(ext: str):
+    pre, suf = COMMENT_STYLES[ext]
+    return pre.encode("utf-8"), suf.encode("utf-8")
+
+def header_bytes(ext: str, rel: str, in_use: bool, eol: bytes) -> bytes:
+    """The exact TRUE_LOCATION + IN_USE pair build_comment would produce, as bytes."""
+    pre, suf = _comment_affixes(ext)
+    return b"".join((pre, b"TRUE_LOCATION: ", rel.encode("utf-8"), suf, eol,
+                     pre, b"IN_USE: ", b"TRUE" if in_use else b"FALSE", suf, eol))
+
+def lower_ext(ext: str) -> str:
+    # Extensions are nearly always lowercase already; islower() doesn't allocate
+    return ext if ext.islower() or not ext else ext.lower()
+
 def detect_style(path: Path):
-    ext = path.suffix.lower()
+    ext = lower_ext(path.suffix)
     return COMMENT_STYLES.get(ext), ext
 
+# Bytes that can appear in text files; anything else marks the file binary
+_TEXTCHARS = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+
 def is_binary(path: Path, sniff=2048) -> bool:
     try:
         with path.open("rb") as f:
             chunk = f.read(sniff)
-        if b"\x00" in chunk:
-            return True
-        chunk.decode("utf-8")
-        return False
     except Exception:
         return True
+    if b"\x00" in chunk:
+        return True
+    return bool(chunk.translate(None, _TEXTCHARS))
+
+class FileIndex:
+    """
+    Every file/dir seen by the walk, so resolution can answer is_file()/is_dir()
+    with a set lookup instead of a stat. The answer is only authoritative
+    inside the walked scan dirs (and, unless hidden entries were walked, for
+    paths with no dot-named component); anything else falls back to the FS.
+    """
+    _fold = staticmethod(str.lower if os.name == "nt" or sys.platform == "darwin" else str)
+
+    def __init__(self, scan_dirs, include_hidden: bool):
+        self.prefixes = tuple(self._fold(os.path.join(str(d), "")) for d in scan_dirs)
+        self.include_hidden = include_hidden
+        self.files = set()
+        self.dirs = {self._fold(str(d)) for d in scan_dirs}
+
+    def add_file(self, p: str): self.files.add(self._fold(p))
+    def add_dir(self, p: str): self.dirs.add(self._fold(p))
+
+    def _covers(self, key: str) -> bool:
+        for pre in self.prefixes:
+            if key.startswith(pre) or key == pre[:-1]:
+                return self.include_hidden or (os.sep + ".") not in key[len(pre) - 1:]
+        return False
+
+    def is_file(self, p) -> bool:
+        s = str(p); key = self._fold(s)
+        return key in self.files if self._covers(key) else os.path.isfile(s)
+
+    def is_dir(self, p) -> bool:
+        s = str(p); key = self._fold(s)
+        return key in self.dirs if self._covers(key) else os.path.isdir(s)
+
+    def exists(self, p) -> bool:
+        return self.is_file(p) or self.is_dir(p)
+
+class _StatIndex:
+    """Fallback used before any walk has run: plain filesystem checks."""
+    is_file = staticmethod(os.path.isfile)
+    is_dir = staticmethod(os.path.isdir)
+    exists = staticmethod(os.path.exists)
+
+# Index for the current scan; compute_results swaps in a fresh one per run
+FILE_INDEX = _StatIndex()
+
+def walk_files(base: Path, include_hidden: bool, allowed_exts=None, index=None, seen=None):
+    """
+    Yield files under base using os.scandir (DirEntry caches the d_type, so no
+    extra stat per entry). Hidden entries are pruned unless include_hidden;
+    directory symlinks are not followed. If index is given, every file/dir
+    visited (regardless of allowed_exts) is recorded in it. If seen (a set of
+    path strings) is given, files already in it are skipped and new ones added,
+    so overlapping scan dirs / symlinks are deduped during the walk.
+    """
+    stack = [str(base)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if not include_hidden and e.name.startswith('.'):
+                    continue
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                    if index is not None: index.add_dir(e.path)
+                    continue
+                if e.is_symlink() and e.is_dir():
+                    continue  # symlinked dir: not followed, and not a file
+                if index is not None and e.is_file():
+                    index.add_file(e.path)
+                if allowed_exts is None or lower_ext(os.path.splitext(e.name)[1]) in allowed_exts:
+                    key = os.path.realpath(e.path) if e.is_symlink() else e.path
+                    if seen is not None:
+                        if key in seen: continue
+                        seen.add(key)
+                    yield Path(key)
 
 def norm_rel(root: Path, target: Path) -> str:
     return os.path.relpath(target, root).replace("\\", "/")
 
 def looks_relative(s: str) -> bool:
-    return s.startswith("./") or s.startswith("../") or s.startswith("/")
+    return s.startswith(("./", "../", "/"))
+
+QUERY_FRAG_RE = re.compile(r"[#?].*", re.DOTALL)
 
 def resolve_relative(base_file: Path, rel: str, root: Path):
-    rel = rel.split("#", 1)[0].split("?", 1)[0]
+    # Siblings importing the same spec share one cached lookup
+    return _resolve_in_dir(base_file.parent, rel, root)
+
+@lru_cache(maxsize=65536)
+def _resolve_in_dir(base_dir: Path, rel: str, root: Path):
+    rel = QUERY_FRAG_RE.sub("", rel, count=1)
     if rel.startswith("/"):
         candidate = (root / rel.lstrip("/")).resolve()
         return try_extensions(candidate)
-    candidate = (base_file.parent / rel).resolve()
+    candidate = (base_dir / rel).resolve()
     return try_extensions(candidate)
 
-COMMON_EXTS = ["", ".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs",
-               ".css", ".scss", ".less", ".html", ".htm", ".py"]
+COMMON_EXTS = ("", ".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs",
+               ".css", ".scss", ".less", ".html", ".htm", ".py")
+INDEX_FILES = tuple(os.sep + "index" + ext for ext in
+                    (".js", ".ts", ".tsx", ".jsx", ".mjs", ".cjs", ".html", ".htm", ".py"))
+@lru_cache(maxsize=65536)
 def try_extensions(path: Path):
-    if path.is_file():
-        return path
-    for ext in COMMON_EXTS:
-        p = Path(str(path) + ext)
-        if p.is_file():
-            return p
-    if path.is_dir():
-        for ext in [".js", ".ts", ".tsx", ".jsx", ".mjs", ".cjs", ".html", ".htm", ".py"]:
-            p = path / f"index{ext}"
-            if p.is_file():
-                return p
+    # Probe with plain strings; only build a Path for the hit
+    is_file = FILE_INDEX.is_file
+    base = str(path)
+    for ext in COMMON_EXTS:  # "" first: the path itself
+        if is_file(base + ext):
+            return Path(base + ext) if ext else path
+    if FILE_INDEX.is_dir(base):
+        for name in INDEX_FILES:
+            if is_file(base + name):
+                return Path(base + name)
     return None
 
+def clear_resolve_caches():
+    """Drop memoized lookups; files may have been renamed/deleted since the last scan."""
+    _resolve_in_dir.cache_clear()
+    try_extensions.cache_clear()
+
+HEADER_PROBE = 4096       # bytes read to decide whether a stamp is needed
+SPLICE_MIN   = 64 * 1024  # tails at least this big are copied with os.sendfile
+
+def _header_end(buf: bytes) -> int:
+    """Offset just past the third line break in buf, or -1 if there are fewer."""
+    pos = 0
+    for _ in range(3):
+        nl = buf.find(b"\n", pos)
+        if nl < 0:
+            return -1
+        pos = nl + 1
+    return pos
+
+def _copy_tail(src, dst, offset: int, count: int):
+    if count >= SPLICE_MIN and hasattr(os, "sendfile"):
+        try:
+            while count > 0:
+                sent = os.sendfile(dst.fileno(), src.fileno(), offset, count)
+                if sent == 0: break
+                offset += sent; count -= sent
+            return
+        except OSError:
+            pass  # e.g. unsupported fs; finish with a userspace copy
+    src.seek(offset)
+    shutil.copyfileobj(src, dst)
+
+def atomic_rewrite_head(path: Path, head: bytes, tail_offset: int):
+    """
+    Replace everything before tail_offset with head, keeping the remaining
+    bytes as-is. Written via a temp file in the same dir + os.replace, so a
+    half-written file is never left behind.
+
+    The result is a new inode: mode and (best-effort) owner/group are carried
+    over, but hard links to the old file, ACLs and xattrs are not preserved.
+    """
+    import tempfile  # deferred: only needed once something is actually written
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as dst, path.open("rb") as src:
+            st = os.fstat(src.fileno())
+            dst.write(head)
+            dst.flush()
+            _copy_tail(src, dst, tail_offset, st.st_size - tail_offset)
+        shutil.copymode(path, tmp)  # mkstemp creates 0600
+        if hasattr(os, "chown"):
+            try: os.chown(tmp, st.st_uid, st.st_gid)
+            except OSError: pass  # not permitted for non-root on a foreign-owned file
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+
 def safe_bak_path(path: Path) -> Path:
     """Return a non-conflicting *.bak path, e.g. file.ext.bak, file.ext.bak2, ..."""
     base = path.with_suffix(path.suffix + ".bak")
@@ -111,69 +278,84 @@ def safe_bak_path(path: Path) -> Path:
 
 # ---------------- Edge extractors ----------------
 JS_IMPORT_RE = re.compile(r"""(?x)(?:import\s+[^'"]*from\s*|import\s*\(\s*|require\s*\(\s*)['"]([^'"]+)['"]""")
-CSS_IMPORT_RE = re.compile(r"""@import\s+(?:url\()?['"]?([^'")]+)['"]?\)?""", re.IGNORECASE)
-CSS_URL_RE    = re.compile(r"""url\(\s*['"]?([^'")]+)['"]?\s*\)""", re.IGNORECASE)
+# One pass over CSS text: @import targets and url(...) refs. `@import url(...)`
+# is left to the url branch; quoted imports may contain spaces, bare ones stop
+# at whitespace or ';'.
+CSS_REF_RE    = re.compile(
+    r"""@import\s+(?!url\()(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<imp>[^'")\s;]+))"""
+    r"""|url\(\s*['"]?(?P<url>[^'")]+)['"]?\s*\)""",
+    re.IGNORECASE | re.ASCII)
+PY_RELIMPORT_RE = re.compile(r"^\s*from\s+(\.+)([a-zA-Z0-9_.]*)\s+import\s", re.MULTILINE)
+
+# HTML refs the way HTMLParser saw them: attributes of start tags only, so
+# comments and script/style bodies are blanked out first (tags themselves kept).
+HTML_SKIP_RE  = re.compile(
+    r"""<!--.*?(?:-->|\Z)|(<(script|style)\b(?:"[^"]*"|'[^']*'|[^'">])*>).*?(?:</\2\s*>|\Z)""",
+    re.IGNORECASE | re.DOTALL | re.ASCII)
+HTML_TAG_RE   = re.compile(r"""<[a-zA-Z][^\s/>]*((?:"[^"]*"|'[^']*'|[^'">])*)>""", re.ASCII)
+# Consumes attributes in order, so text inside a quoted value is never re-scanned
+HTML_ATTR_RE  = re.compile(r"""([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+)))?""", re.ASCII)
+HTML_REF_ATTRS = frozenset(("src", "href", "data-src", "poster"))
+
+def _resolve_specs(path: Path, root: Path, specs):
+    edges = []
+    for spec in specs:
+        if looks_relative(spec):
+            tgt = resolve_relative(path, spec, root)
+            if tgt: edges.append(tgt)
+    return edges
 
-class SimpleHTMLRefParser(HTMLParser):
-    def __init__(self): super().__init__(); self.refs=[]
-    def handle_starttag(self, tag, attrs):
-        d = dict(attrs)
-        for key in ("src","href","data-src","poster"):
-            if key in d: self.refs.append(d[key])
+def _scan_js(text: str, path: Path, root: Path):
+    return _resolve_specs(path, root, (m.group(1).strip() for m in JS_IMPORT_RE.finditer(text)))
 
-def extract_edges_for_file(path: Path, root: Path):
-    ext = path.suffix.lower()
+def _scan_py(text: str, path: Path, root: Path):
+    # Line scan instead of ast.parse: only `from .x import y` matters here
     edges = []
+    for m in PY_RELIMPORT_RE.finditer(text):
+        dots, module = m.groups()
+        if not module:
+            continue  # `from . import x` names no module path
+        rel = "./" + "../" * (len(dots) - 1) + module.replace(".", "/")
+        tgt = resolve_relative(path, rel + ".py", root) or resolve_relative(path, rel, root)
+        if tgt: edges.append(tgt)
+    return edges
+
+def _html_refs(text: str):
+    text = HTML_SKIP_RE.sub(lambda m: m.group(1) or "", text)
+    for tag in HTML_TAG_RE.finditer(text):
+        for a in HTML_ATTR_RE.finditer(tag.group(1)):
+            if a.group(1).lower() in HTML_REF_ATTRS:
+                v = a.group(2) or a.group(3) or a.group(4) or ""
+                if "&" in v:
+                    from html import unescape  # deferred: entity refs in paths are rare
+                    v = unescape(v)
+                yield v.strip()
+
+def _scan_html(text: str, path: Path, root: Path):
+    return _resolve_specs(path, root, _html_refs(text))
+
+def _scan_css(text: str, path: Path, root: Path):
+    return _resolve_specs(path, root, ((m.group("dq") or m.group("sq") or m.group("imp")
+                                        or m.group("url") or "").strip()
+                                       for m in CSS_REF_RE.finditer(text)))
+
+EDGE_HANDLERS = {
+    ".js": _scan_js, ".jsx": _scan_js, ".ts": _scan_js, ".tsx": _scan_js,
+    ".mjs": _scan_js, ".cjs": _scan_js,
+    ".py": _scan_py,
+    ".html": _scan_html, ".htm": _scan_html,
+    ".css": _scan_css, ".scss": _scan_css, ".less": _scan_css,
+}
+
+def extract_edges_for_file(path: Path, root: Path):
+    handler = EDGE_HANDLERS.get(lower_ext(path.suffix))
+    if handler is None:
+        return []  # no extractor: don't read/decode the file at all
     try:
         text = path.read_text(encoding="utf-8")
     except Exception:
-        return edges
-
-    if ext in {".js",".jsx",".ts",".tsx",".mjs",".cjs"}:
-        for m in JS_IMPORT_RE.finditer(text):
-            spec = m.group(1).strip()
-            if looks_relative(spec):
-                tgt = resolve_relative(path, spec, root)
-                if tgt: edges.append(tgt)
-
-    elif ext == ".py":
-        try:
-            tree = ast.parse(text, filename=str(path))
-            for node in ast.walk(tree):
-                if isinstance(node, ast.ImportFrom) and node.level and node.module:
-                    rel = "./" + node.module.replace(".", "/")
-                    tgt = resolve_relative(path, rel + ".py", root) or resolve_relative(path, rel, root)
-                    if tgt: edges.append(tgt)
-        except Exception:
-            for m in re.finditer(r"from\s+(\.+[a-zA-Z0-9_\.]+)\s+import\s+", text):
-                module = m.group(1).strip(".").replace(".", "/")
-                rel = "./" + module
-                tgt = resolve_relative(path, rel + ".py", root) or resolve_relative(path, rel, root)
-                if tgt: edges.append(tgt)
-
-    elif ext in {".html",".htm"}:
-        parser = SimpleHTMLRefParser()
-        try:
-            parser.feed(text)
-            for ref in parser.refs:
-                if looks_relative(ref):
-                    tgt = resolve_relative(path, ref, root)
-                    if tgt: edges.append(tgt)
-        except Exception:
-            pass
-
-    elif ext in {".css",".scss",".less"}:
-        for m in CSS_IMPORT_RE.finditer(text):
-            spec = m.group(1).strip()
-            if looks_relative(spec):
-                tgt = resolve_relative(path, spec, root)
-                if tgt: edges.append(tgt)
-        for m in CSS_URL_RE.finditer(text):
-            spec = m.group(1).strip()
-            if looks_relative(spec):
-                tgt = resolve_relative(path, spec, root)
-                if tgt: edges.append(tgt)
-    return edges
+        return []
+    return handler(text, path, root)
 
 # ---------------- Graph + reachability ----------------
 def detect_roots(root: Path, scan_dirs):
@@ -183,6 +365,8 @@ def detect_roots(root: Path, scan_dirs):
         "main.tsx","src/main.tsx","src/index.tsx",
         "app.py","wsgi.py","run.py",
     ]
+    # Only a handful of candidates, so stat them directly: the index is keyed
+    # by walked (unresolved) paths and would miss roots behind a symlink.
     roots=[]
     for c in candidates:
         p = (root / c)
@@ -196,21 +380,53 @@ def detect_roots(root: Path, scan_dirs):
     return list(dict.fromkeys(roots))
 
 def build_graph(root: Path, files):
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as ex:
+        deps_per_file = list(ex.map(lambda f: extract_edges_for_file(f, root), files))
+    # Fill the graph on this thread once all reads are done (no locking needed)
     edges = defaultdict(set)
-    for f in files:
-        for dep in extract_edges_for_file(f, root):
-            edges[f].add(dep)
+    for f, deps in zip(files, deps_per_file):
+        if deps: edges[f].update(deps)
     return edges
 
+def build_csr(graph, roots):
+    """
+    Number every node once and flatten the edge sets into CSR arrays:
+    the neighbours of node i are indices[indptr[i]:indptr[i+1]].
+    """
+    idx = {}
+    for p in roots:
+        idx.setdefault(p, len(idx))
+    for src, deps in graph.items():
+        idx.setdefault(src, len(idx))
+        for d in deps:
+            idx.setdefault(d, len(idx))
+    nodes = list(idx)  # insertion order == id order
+    indptr = array("l", [0])
+    indices = array("l")
+    for p in nodes:
+        indices.extend(idx[d] for d in graph.get(p, ()))
+        indptr.append(len(indices))
+    return nodes, idx, indptr, indices
+
 def reachable_from(graph, roots):
-    seen=set(); q=deque()
+    nodes, idx, indptr, indices = build_csr(graph, roots)
+    n = len(nodes)
+    # One flag byte per node + a queue that can hold every node once:
+    # each node is enqueued at most once, so head/tail never wrap.
+    seen = bytearray(n)
+    queue = [0] * n
+    tail = 0
     for r in roots:
-        if r.exists(): seen.add(r); q.append(r)
-    while q:
-        cur=q.popleft()
-        for nxt in graph.get(cur, ()):
-            if nxt not in seen: seen.add(nxt); q.append(nxt)
-    return seen
+        i = idx[r]
+        if not seen[i] and r.exists():
+            seen[i] = 1; queue[tail] = i; tail += 1
+    head = 0
+    while head < tail:
+        cur = queue[head]; head += 1
+        for nxt in indices[indptr[cur]:indptr[cur + 1]]:
+            if not seen[nxt]:
+                seen[nxt] = 1; queue[tail] = nxt; tail += 1
+    return {nodes[i] for i in queue[:tail]}
 
 # ---------------- File stamping / renaming ----------------
 def update_header_comments(path: Path, root: Path, in_use: bool, dry_run=False, no_backup=False):
@@ -253,19 +469,36 @@ def update_header_comments(path: Path, root: Path, in_use: bool, dry_run=False,
         if ext in UNCOMMENTABLE:
             return f"SKIP (no comments): {path}"
 
-    # From here: text + commentable
+    # From here: text + commentable.
+    # Only lines 0-2 can change, so read just enough bytes to cover them; the
+    # rest of the file is never decoded and is copied through untouched.
+    rel = norm_rel(root, path)
     try:
-        text = path.read_text(encoding="utf-8")
+        with path.open("rb") as f:
+            head = f.read(HEADER_PROBE)
+            # Fast path: header already exactly as we'd write it -> nothing to decode
+            nl = head.find(b"\n")
+            first = head[:nl + 1] if nl >= 0 else head
+            body = head[len(first):] if first.lstrip().startswith(b"#!") else head
+            eol = b"\r\n" if first.endswith(b"\r\n") else b"\n"
+            if body.startswith(header_bytes(ext, rel, in_use, eol)):
+                return f"OK (up-to-date):    {path}  IN_USE={'TRUE' if in_use else 'FALSE'}"
+            cut = _header_end(head)
+            if cut < 0:
+                head += f.read()  # fewer than 3 lines in the probe (e.g. minified)
+                cut = _header_end(head)
+                if cut < 0: cut = len(head)
+        text = head[:cut].decode("utf-8")
     except UnicodeDecodeError:
         return f"SKIP (decode UTF-8): {path}"
     except Exception as e:
         return f"ERROR (read):        {path} ({e})"
 
-    rel = norm_rel(root, path)
-    desired_true = build_comment(ext, "TRUE_LOCATION", rel)
-    desired_use  = build_comment(ext, "IN_USE", "TRUE" if in_use else "FALSE")
-
     lines = text.splitlines(keepends=True)
+    eol = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"  # match the file
+    desired_true = build_comment(ext, "TRUE_LOCATION", rel).replace("\n", eol)
+    desired_use  = build_comment(ext, "IN_USE", "TRUE" if in_use else "FALSE").replace("\n", eol)
+
     has_shebang = bool(lines and lines[0].lstrip().startswith("#!"))
     base_idx = 1 if has_shebang else 0
 
@@ -279,7 +512,7 @@ def update_header_comments(path: Path, root: Path, in_use: bool, dry_run=False,
             return False
         lines_list[idx:idx]=[key_comment]; return True
 
-    new_lines = list(lines)
+    new_lines = lines
     changed = False
     changed |= ensure_line(new_lines, base_idx, desired_true)
     use_idx = base_idx + 1
@@ -292,26 +525,36 @@ def update_header_comments(path: Path, root: Path, in_use: bool, dry_run=False,
         return f"WRITE (dry-run):    {path}  IN_USE={'TRUE' if in_use else 'FALSE'}"
 
     try:
-        path.write_text("".join(new_lines), encoding="utf-8")
+        atomic_rewrite_head(path, "".join(new_lines).encode("utf-8"), cut)
         # Clarify if this was a rename path for unused
         return f"WROTE:              {path}  IN_USE={'TRUE' if in_use else 'FALSE'}"
     except Exception as e:
         return f"ERROR (write):      {path} ({e})"
 
+def _stamp_one(job):
+    # Top-level so ProcessPoolExecutor can pickle it
+    path, root, in_use, dry_run, no_backup = job
+    return update_header_comments(path, root, in_use, dry_run=dry_run, no_backup=no_backup)
+
 # ---------------- Report building ----------------
 def list_tree(root: Path, used_files):
     used_rel = sorted(norm_rel(root, f) for f in used_files)
     tree = []
-    prev_parts = []
+    prev_dir, prev_parts, file_indent = None, [], ""
     for rel in used_rel:
-        parts = rel.split("/")
-        i=0
-        while i < min(len(parts), len(prev_parts)) and parts[i]==prev_parts[i]:
-            i+=1
-        for j in range(i, len(parts)):
-            indent = "  " * j
-            tree.append(f"{indent}{parts[j]}")
-        prev_parts = parts
+        cut = rel.rfind("/")
+        d = rel[:cut] if cut >= 0 else ""
+        if d != prev_dir:
+            # New directory: emit only the components not shared with the last one
+            parts = d.split("/") if d else []
+            i=0
+            while i < min(len(parts), len(prev_parts)) and parts[i]==prev_parts[i]:
+                i+=1
+            for j in range(i, len(parts)):
+                tree.append("  " * j + parts[j])
+            prev_dir, prev_parts, file_indent = d, parts, "  " * len(parts)
+        # Sorted input keeps siblings together, so this is the common case
+        tree.append(file_indent + rel[cut + 1:])
     return "\n".join(tree) if tree else "(none)"
 
 def categorize_folders(root: Path, all_files, used_files, scan_dirs):
@@ -319,26 +562,31 @@ def categorize_folders(root: Path, all_files, used_files, scan_dirs):
     used_set = set(used_files)
     unused_set = all_files_set - used_set
 
+    # Work on plain path strings: no Path objects per ancestor, and one
+    # tuple-startswith per directory instead of re-stringifying scan dirs.
+    sd_prefixes = tuple(os.path.join(str(sd), "") for sd in scan_dirs)
+    used_strs = {str(f) for f in used_set}
     dir_files = defaultdict(set)
     for f in all_files_set:
-        d = f.parent
-        while True:
-            if any(str(d).startswith(str(sd)) for sd in scan_dirs):
-                dir_files[d].add(f)
-            if d == d.parent: break
-            d = d.parent
+        fs = str(f)
+        d = os.path.dirname(fs)
+        # Ancestors of a dir outside every scan dir are outside too: stop there
+        while os.path.join(d, "").startswith(sd_prefixes):
+            dir_files[d].add(fs)
+            parent = os.path.dirname(d)
+            if parent == d: break
+            d = parent
 
     unnecessary = []
     keep = []
     for d, files in dir_files.items():
-        if not files: continue
-        if files.issubset(unused_set):
+        if files.isdisjoint(used_strs):
             unnecessary.append(d)
-        elif any(f in used_set for f in files) and any(f in unused_set for f in files):
+        elif not files.issubset(used_strs):  # some used, some unused
             keep.append(d)
 
-    unnecessary = sorted(set(unnecessary), key=lambda p: norm_rel(root, p))
-    keep        = sorted(set(keep), key=lambda p: norm_rel(root, p))
+    unnecessary = sorted((Path(d) for d in unnecessary), key=lambda p: norm_rel(root, p))
+    keep        = sorted((Path(d) for d in keep), key=lambda p: norm_rel(root, p))
     return unnecessary, keep, sorted(unused_set, key=lambda p: norm_rel(root, p))
 
 def write_results_file(root: Path, used_files, unnecessary_dirs, keep_dirs, other_unused_files):
@@ -394,21 +642,10 @@ def print_fs_tree_stdout(root: Path, scan_dirs, include_hidden: bool):
     No reachability analysis; just list everything we see.
     Show a directory tree of all non-.bak files, then a separate list of .bak files.
     """
-    def should_visit(p: Path):
-        name = p.name
-        if not include_hidden and name.startswith('.'):
-            return False
-        return True
-
     all_files = []
+    seen = set()
     for base in scan_dirs:
-        for p in base.rglob("*"):
-            if p.is_dir():
-                if not should_visit(p): continue
-                continue
-            if not should_visit(p): continue
-            all_files.append(p.resolve())
-    all_files = list(dict.fromkeys(all_files))
+        all_files.extend(walk_files(base, include_hidden, seen=seen))
 
     non_bak = [p for p in all_files if not is_bak(p)]
     bak_only = [p for p in all_files if is_bak(p)]
@@ -427,22 +664,16 @@ def print_fs_tree_stdout(root: Path, scan_dirs, include_hidden: bool):
 
 # ---------------- Compute (shared) ----------------
 def compute_results(root: Path, scan_dirs, allowed_exts, roots_cli=None, include_hidden=False, dry_run=False, no_backup=False):
-    def should_visit(p: Path):
-        name = p.name
-        if not include_hidden and name.startswith('.'): return False
-        return True
+    global FILE_INDEX
+    clear_resolve_caches()
 
-    # Collect files
+    # Collect files (the same walk fills the index used for resolution)
+    index = FileIndex(scan_dirs, include_hidden)
     files=[]
+    seen = set()
     for base in scan_dirs:
-        for p in base.rglob("*"):
-            if p.is_dir():
-                if not should_visit(p): continue
-                continue
-            if not should_visit(p): continue
-            if p.suffix.lower() in allowed_exts:
-                files.append(p.resolve())
-    files = list(dict.fromkeys(files))
+        files.extend(walk_files(base, include_hidden, allowed_exts, index=index, seen=seen))
+    FILE_INDEX = index
 
     # Roots
     if roots_cli:
@@ -455,18 +686,30 @@ def compute_results(root: Path, scan_dirs, allowed_exts, roots_cli=None, include
     else:
         roots = detect_roots(root, scan_dirs)
         if not roots:
-            html_roots = [f for f in files if f.suffix.lower() in (".html",".htm")]
+            html_roots = [f for f in files if lower_ext(f.suffix) in (".html",".htm")]
             roots = html_roots[:10]
 
     # Graph/reachability
     graph = build_graph(root, files)
     used = reachable_from(graph, roots)
 
-    # Stamp or rename
-    for f in files:
-        in_use = f in used
-        msg = update_header_comments(f, root, in_use, dry_run=dry_run, no_backup=no_backup)
-        print(msg)
+    # Stamp or rename (map() keeps messages in file order)
+    jobs = [(f, root, f in used, dry_run, no_backup) for f in files]
+    if len(jobs) < PROCESS_MIN_FILES:
+        with ThreadPoolExecutor(max_workers=IO_WORKERS) as ex:
+            for msg in ex.map(_stamp_one, jobs):
+                print(msg)
+    else:
+        # Deferred: pulls in multiprocessing, which report-only/small runs never need
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn, not fork: the GUI runs this on a worker thread next to Tk.
+        # Windows caps process pools at 61 workers.
+        workers = min(61, os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as ex:
+            for msg in ex.map(_stamp_one, jobs, chunksize=64):
+                print(msg)
 
     unnecessary_dirs, keep_dirs, other_unused_files = categorize_folders(root, files, used, scan_dirs)
     write_results_file(root, used_files=sorted(used), unnecessary_dirs=unnecessary_dirs,
@@ -477,18 +720,61 @@ def compute_results(root: Path, scan_dirs, allowed_exts, roots_cli=None, include
 def launch_gui(root: Path, scan_dirs, allowed_exts, roots_cli=None):
     import tkinter as tk
     from tkinter import ttk, messagebox, filedialog
+    import queue, threading
 
     # current, mutable selections
     current_root = Path(root)
     current_scan_dirs = [Path(d) for d in scan_dirs]
 
-    # Run an initial compute
+    # Scans run on a worker thread; results come back through this queue so
+    # only the Tk thread touches widgets and mainloop keeps repainting.
+    results_q = queue.Queue()
+    scanning = [False]
+    rescan_pending = [False]  # a rescan was requested while one was running
+    mutating_btns = []        # controls that change the tree/scan set; off while scanning
+
+    def set_busy(busy):
+        scanning[0] = busy
+        for b in mutating_btns:
+            b.config(state="disabled" if busy else "normal")
+
     def run_compute_and_refresh():
+        if scanning[0]:
+            rescan_pending[0] = True
+            return
+        set_busy(True)
         # ensure dirs exist
         valid_scan = [d for d in current_scan_dirs if d.exists() and d.is_dir()]
-        files, used, unnecessary_dirs, keep_dirs, other_unused_files = compute_results(
-            current_root, valid_scan, allowed_exts, roots_cli=roots_cli, include_hidden=False, dry_run=False, no_backup=False
-        )
+        scan_root = current_root
+
+        def work():
+            try:
+                res = compute_results(
+                    scan_root, valid_scan, allowed_exts, roots_cli=roots_cli, include_hidden=False, dry_run=False, no_backup=False
+                )
+                results_q.put((valid_scan, res, None))
+            except Exception as e:
+                results_q.put((valid_scan, None, e))
+
+        threading.Thread(target=work, daemon=True).start()
+        win.after(100, poll_results)
+
+    def poll_results():
+        try:
+            valid_scan, res, err = results_q.get_nowait()
+        except queue.Empty:
+            win.after(100, poll_results)
+            return
+        set_busy(False)
+        if rescan_pending[0]:
+            # Results are already stale (dirs/root changed meanwhile): scan again
+            rescan_pending[0] = False
+            run_compute_and_refresh()
+            return
+        if err is not None:
+            messagebox.showerror("Scan failed", str(err))
+            return
+        files, used, unnecessary_dirs, keep_dirs, other_unused_files = res
         # refresh lists
         for w in (files_list, dirs_list):
             for child in w.get_children():
@@ -521,7 +807,8 @@ def launch_gui(root: Path, scan_dirs, allowed_exts, roots_cli=None):
             current_root = Path(new).resolve()
             run_compute_and_refresh()
 
-    ttk.Button(topbar, text="Change root…", command=choose_root).pack(side="left", padx=8)
+    root_btn = ttk.Button(topbar, text="Change root…", command=choose_root)
+    root_btn.pack(side="left", padx=8)
 
     scans_label_var = tk.StringVar(value="Scan dirs:\n" + "\n".join(str(d) for d in current_scan_dirs))
     scans_box = ttk.Label(win, textvariable=scans_label_var, anchor="w", justify="left")
@@ -548,6 +835,9 @@ def launch_gui(root: Path, scan_dirs, allowed_exts, roots_cli=None):
             lb.insert(i, str(d))
         lb.pack(fill="both", expand=True, padx=8, pady=8)
         def do_remove():
+            if scanning[0]:
+                messagebox.showinfo("Scan running", "Wait for the current scan to finish.", parent=choices)
+                return
             sel = list(lb.curselection())
             if not sel:
                 choices.destroy(); return
@@ -558,9 +848,12 @@ def launch_gui(root: Path, scan_dirs, allowed_exts, roots_cli=None):
         ttk.Button(choices, text="Remove selected", command=do_remove).pack(pady=6)
         ttk.Button(choices, text="Cancel", command=choices.destroy).pack(pady=2)
 
-    ttk.Button(toolbar, text="Add scan dir…", command=add_scan_dir).pack(side="left")
-    ttk.Button(toolbar, text="Remove scan dir…", command=remove_scan_dir).pack(side="left", padx=6)
-    ttk.Button(toolbar, text="Rescan / Restamp", command=run_compute_and_refresh).pack(side="left", padx=12)
+    add_btn = ttk.Button(toolbar, text="Add scan dir…", command=add_scan_dir)
+    add_btn.pack(side="left")
+    remove_btn = ttk.Button(toolbar, text="Remove scan dir…", command=remove_scan_dir)
+    remove_btn.pack(side="left", padx=6)
+    rescan_btn = ttk.Button(toolbar, text="Rescan / Restamp", command=run_compute_and_refresh)
+    rescan_btn.pack(side="left", padx=12)
 
     # Panes
     pane = ttk.Panedwindow(win, orient=tk.HORIZONTAL); pane.pack(fill="both", expand=True, padx=10, pady=10)
@@ -601,6 +894,8 @@ def launch_gui(root: Path, scan_dirs, allowed_exts, roots_cli=None):
 
     def do_delete():
         from tkinter import messagebox
+        if scanning[0]:
+            return  # never move/delete while the worker is walking/stamping the tree
         files_sel = gather_selected(files_list)
         dirs_sel  = gather_selected(dirs_list)
         if not files_sel and not dirs_sel:
@@ -632,8 +927,10 @@ def launch_gui(root: Path, scan_dirs, allowed_exts, roots_cli=None):
             messagebox.showinfo("Done", "Selected items processed.")
         run_compute_and_refresh()  # refresh after delete
 
-    ttk.Button(bottom, text="Delete selected", command=do_delete).pack(side="right")
+    delete_btn = ttk.Button(bottom, text="Delete selected", command=do_delete)
+    delete_btn.pack(side="right")
     ttk.Button(bottom, text="Close", command=win.destroy).pack(side="right", padx=8)
+    mutating_btns.extend((root_btn, add_btn, remove_btn, rescan_btn, delete_btn))
 
     # Initial compute + fill
     run_compute_and_refresh()